@@ -0,0 +1,58 @@
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import_time(module: str = "main") -> list[tuple[int, int, str]]:
+    """
+    Import a module in a fresh interpreter with "-X importtime" and collect the timings.
+
+    :param module: The module to import.
+
+    :return: A list of (self time, cumulative time, module name) tuples in microseconds.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_time, cumulative_time, name = line.removeprefix("import time:").split("|", 2)
+        timings.append((int(self_time), int(cumulative_time), name.removeprefix(" ").rstrip()))
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup import time of the bot.")
+    parser.add_argument("--module", default="main", help="The module to import.")
+    parser.add_argument("--runs", type=int, default=5, help="How many fresh interpreters to measure, the best run is reported.")
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest top-level imports to list.")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Exit with a non-zero status if the total import time exceeds this budget.")
+    args = parser.parse_args()
+
+    best_total, best_timings = None, None
+    for _ in range(args.runs):
+        timings = measure_import_time(args.module)
+        total = sum(cumulative for _, cumulative, name in timings if not name.startswith(" "))
+        if best_total is None or total < best_total:
+            best_total, best_timings = total, timings
+
+    print(f"Total import time of {args.module}: {best_total / 1000:.1f}ms (best of {args.runs})")
+    top_level = sorted((timing for timing in best_timings if not timing[2].startswith(" ")), key=lambda timing: timing[1], reverse=True)
+    for _, cumulative, name in top_level[:args.top]:
+        print(f"{cumulative / 1000:>10.1f}ms  {name}")
+
+    if args.budget_ms is not None and best_total / 1000 > args.budget_ms:
+        print(f"Import time exceeds the budget of {args.budget_ms}ms.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
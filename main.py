@@ -1,11 +1,10 @@
 import os
 import asyncio
 import discord
+import logging
+import math
 import random
 from utils.constants import PRIVILEGED_GUILDS, SENTIMENTS, DEFAULT_SENTIMENT, DEFAULT_QUOTA, GAME_LIST
-from utils.database_utils import UserSettingsHandler
-from utils.response_handler import ResponseHandler
-from utils.prompt_completion import CompletionHandler
 from utils.miscellaneous import capitalize_first_letter, time_until_refresh
 
 
@@ -26,8 +25,10 @@ class DiscordBot:
             await self.bot.change_presence(activity=discord.Game(name=self.presence) if self.presence else None)
             await asyncio.sleep(random.randint(60 * 30, 60 * 60 * 3))
 
-    async def run_bot(self):
-
+    def register_help_commands(self):
+        """
+        Register the informational slash commands, these don't touch the database.
+        """
         @self.bot.command(name="help", description="Get to know more about this bot.")
         async def overview(ctx):
             await ctx.respond(embed=discord.Embed(
@@ -37,6 +38,12 @@ class DiscordBot:
                 color=0xb4bcac
             ))
 
+    def register_settings_commands(self):
+        """
+        Register the slash commands for viewing and changing the user settings.
+        """
+        from utils.database_utils import UserSettingsHandler
+
         @self.bot.command(name="settings", description="View your current settings and quota.")
         async def settings(ctx):
             user_settings = await UserSettingsHandler(ctx.author.id).get_user_settings()
@@ -84,6 +91,15 @@ class DiscordBot:
             allow_images_text = "enabled" if user_settings.allow_images else "disabled"
             await ctx.respond(content=f"**{capitalize_first_letter(ctx.author.name)}**, you have {allow_images_text} image attachments.")
 
+    def register_message_handler(self):
+        """
+        Register the message handler for prompt completions.
+        """
+        from utils.database_utils import UserSettingsHandler
+        from utils.response_handler import ResponseHandler
+        from utils.prompt_completion import CompletionHandler
+        from utils.rate_limiting import RateLimiter
+
         @self.bot.event
         async def on_message(message: discord.Message):
             if (f"<@{self.bot.user.id}>" in message.content or message.guild is None) and not message.author.bot:
@@ -95,7 +111,14 @@ class DiscordBot:
                         else:
                             user_settings = await UserSettingsHandler(message.author.id).get_user_settings()
                             if user_settings.quota > 0 or message.guild is not None and message.guild.id in PRIVILEGED_GUILDS and not user_settings.use_legacy:
-                                if not user_settings.use_legacy:
+                                rate_limits = {"user": user_settings.user_hash, "openai": "global"}
+                                if message.guild is not None:
+                                    rate_limits["guild"] = message.guild.id
+
+                                rate_limit = await RateLimiter(rate_limits).acquire()
+                                if not rate_limit.allowed:
+                                    await ResponseHandler(message).send_response(f"**{capitalize_first_letter(message.author.name)}**, slow down a little, I can't keep up. Please try again in **{math.ceil(rate_limit.retry_after)}s**.")
+                                elif not user_settings.use_legacy:
                                     completion, image_locations = await CompletionHandler(user_settings).complete_prompt(message, prompt, f"you are currently playing {self.presence}" if self.presence else f"you love to play video games but are currently not playing anything")
                                     await ResponseHandler(message).send_response(completion, image_locations)
                                 else:
@@ -107,10 +130,18 @@ class DiscordBot:
                     else:
                         await ResponseHandler(message).send_response("Hello there, I'm a divine being. Ask me anything, or use </help:1123348801369952356> to learn more.")
 
+    async def run_bot(self):
+        self.register_help_commands()
+        self.register_settings_commands()
+        self.register_message_handler()
         await self.bot.start(self.discord_token)
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     bot = DiscordBot(os.getenv("DISCORD_TOKEN"))
     loop = asyncio.get_event_loop()
     loop.create_task(bot.run_bot())
@@ -0,0 +1,73 @@
+import pytest
+from utils.constants import DEFAULT_ROUTING
+from utils.model_routing import ModelRouter, UpstreamStats
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(ModelRouter, "upstream_stats", {})
+    return ModelRouter(None)
+
+
+def degrade(model: str, tier: str):
+    stats = ModelRouter.upstream_stats.setdefault((model, tier), UpstreamStats())
+    stats.record(DEFAULT_ROUTING[f"{tier}_latency_threshold"] * 2)
+
+
+@pytest.mark.parametrize("prompt, tier", [("hi", "short"), ("x" * 100, "medium"), ("x" * 500, "long")])
+def test_routes_by_prompt_length(router, prompt, tier):
+    route = router.route(prompt, 1500, True, True)
+
+    assert route.tier == tier
+    assert route.max_tokens == DEFAULT_ROUTING[f"{tier}_max_tokens"]
+    assert route.attach_functions
+
+
+def test_escalates_to_next_tier(router):
+    route = router.route("Explain general relativity in depth", 1500, False, True)
+
+    medium = router.escalate(route, 1500, False, True)
+    long = router.escalate(medium, 1500, False, True)
+
+    assert (medium.tier, medium.max_tokens) == ("medium", DEFAULT_ROUTING["medium_max_tokens"])
+    assert (long.tier, long.max_tokens) == ("long", DEFAULT_ROUTING["long_max_tokens"])
+    assert router.escalate(long, 1500, False, True) is None
+
+
+def test_degraded_model_backs_off_and_is_not_escalated(router):
+    degrade(DEFAULT_ROUTING["model"], "medium")
+
+    route = router.route("x" * 100, 1500, True, True)
+
+    assert route.degraded
+    assert route.max_tokens == DEFAULT_ROUTING["medium_max_tokens"] // 2
+    assert not route.attach_functions
+    assert router.escalate(route, 1500, True, True) is None
+
+
+def test_latency_is_tracked_per_tier(router):
+    degrade(DEFAULT_ROUTING["model"], "long")
+
+    assert router.route("x" * 500, 1500, True, True).degraded
+    assert not router.route("x" * 100, 1500, True, True).degraded
+
+
+def test_quota_cap_is_not_undone_by_floor(router):
+    route = router.route("x" * 100, 3, False, True, legacy=True)
+
+    assert route.max_tokens < DEFAULT_ROUTING["min_max_tokens"]
+    assert router.escalate(route, 3, False, True, legacy=True) is None
+
+
+def test_quota_cap_accounts_for_prompt_tokens(router):
+    quota = 50
+    route = router.route("x" * 100, quota, False, True, prompt_tokens=100)
+
+    assert route.max_tokens == quota * 10 - 100 - DEFAULT_ROUTING["system_prompt_tokens"]
+
+
+def test_privileged_completions_are_not_capped_by_quota(router):
+    route = router.route("x" * 100, 0, True, False)
+
+    assert route.max_tokens == DEFAULT_ROUTING["medium_max_tokens"]
+    assert route.attach_functions
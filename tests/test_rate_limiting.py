@@ -0,0 +1,159 @@
+import asyncio
+import types
+import pytest
+import utils.rate_limiting as rate_limiting
+from utils.rate_limiting import RateLimiter, LocalBucket
+
+LIMITS = {
+    "user": {"capacity": 10, "refill_rate": 0.1},
+    "guild": {"capacity": 10, "refill_rate": 0.1},
+    "openai": {"capacity": 10, "refill_rate": 0.1}
+}
+
+
+class FakeScript:
+    """
+    Python stand-in for TOKEN_BUCKET_SCRIPT running against FakeRedis.
+    """
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __call__(self, keys, args, client):
+        await asyncio.sleep(0)
+        self.redis.calls.append((list(keys), list(args)))
+        if self.redis.fail:
+            raise ConnectionError("Redis is down")
+        if self.redis.block is not None:
+            await self.redis.block.wait()
+
+        now = self.redis.now
+        cost = args[-1]
+        tokens = []
+        allowed = 1
+        retry_after = 0
+
+        for i, key in enumerate(keys):
+            capacity, refill_rate, debt = args[i * 3:i * 3 + 3]
+            available, updated_at = self.redis.buckets.get(key, (capacity, now))
+            tokens.append(min(capacity, available + max(0, now - updated_at) * refill_rate) - max(0, debt))
+            if tokens[i] < cost:
+                allowed = 0
+                retry_after = max(retry_after, (cost - tokens[i]) / refill_rate)
+
+        for i, key in enumerate(keys):
+            if allowed:
+                tokens[i] -= cost
+            self.redis.buckets[key] = (tokens[i], now)
+
+        return [allowed, str(retry_after), *map(str, tokens)]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.buckets = {}
+        self.calls = []
+        self.now = 0.0
+        self.fail = False
+        self.block = None
+
+    def register_script(self, script):
+        return FakeScript(self)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake_redis = FakeRedis()
+    clock = types.SimpleNamespace(now=100.0)
+
+    class FakeConnection:
+        async def __aenter__(self):
+            return fake_redis
+
+        async def __aexit__(self, exc_type, exc, tb):
+            pass
+
+    monkeypatch.setattr(rate_limiting, "RedisConnection", FakeConnection)
+    monkeypatch.setattr(rate_limiting, "RATE_LIMITS", LIMITS)
+    monkeypatch.setattr(rate_limiting, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(RateLimiter, "local_buckets", {})
+    monkeypatch.setattr(RateLimiter, "token_bucket_script", None)
+    fake_redis.clock = clock
+    return fake_redis
+
+
+def test_charges_all_buckets_or_none(redis):
+    redis.buckets["rate_limit:guild:1"] = (0.0, 0.0)
+
+    result = asyncio.run(RateLimiter({"user": "a", "guild": 1}).acquire())
+
+    assert not result.allowed
+    assert result.retry_after == pytest.approx(10)
+    assert redis.buckets["rate_limit:user:a"][0] == 10
+
+
+def test_grants_locally_while_clearly_under_limit(redis):
+    limiter = RateLimiter({"user": "a"})
+
+    async def acquire_twice():
+        return await limiter.acquire(), await limiter.acquire()
+
+    assert all(result.allowed for result in asyncio.run(acquire_twice()))
+    assert len(redis.calls) == 1
+    assert RateLimiter.local_buckets["rate_limit:user:a"].debt == 1
+
+
+def test_concurrent_syncs_charge_debt_once(redis):
+    RateLimiter.local_buckets["rate_limit:openai:global"] = LocalBucket(tokens=4.0, synced_at=100.0, debt=3)
+    limiter = RateLimiter({"openai": "global"})
+
+    async def acquire_concurrently():
+        return await asyncio.gather(limiter.acquire(), limiter.acquire())
+
+    assert all(result.allowed for result in asyncio.run(acquire_concurrently()))
+    assert sorted(args[2] for _, args in redis.calls) == [0, 3]
+    assert redis.buckets["rate_limit:openai:global"][0] == 10 - 3 - 2
+    assert RateLimiter.local_buckets["rate_limit:openai:global"] == LocalBucket(tokens=5.0, synced_at=100.0, debt=0, in_flight=0)
+
+
+def test_in_flight_debt_limits_local_grants(redis):
+    RateLimiter.local_buckets["rate_limit:user:a"] = LocalBucket(tokens=9.0, synced_at=100.0, debt=4)
+    limiter = RateLimiter({"user": "a"})
+
+    async def acquire_during_sync():
+        redis.block = asyncio.Event()
+        sync = asyncio.create_task(limiter.sync_buckets(redis, limiter.buckets, 1))
+        while not redis.calls:
+            await asyncio.sleep(0)
+        granted = limiter.acquire_locally(1)
+        redis.block.set()
+        await sync
+        return granted
+
+    assert not asyncio.run(acquire_during_sync())
+    assert RateLimiter.local_buckets["rate_limit:user:a"].in_flight == 0
+
+
+def test_failed_sync_restores_debt(redis):
+    RateLimiter.local_buckets["rate_limit:user:a"] = LocalBucket(tokens=0.0, synced_at=100.0, debt=4)
+    redis.fail = True
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(RateLimiter({"user": "a"}).acquire())
+
+    assert RateLimiter.local_buckets["rate_limit:user:a"] == LocalBucket(tokens=0.0, synced_at=100.0, debt=4, in_flight=0)
+
+
+def test_stale_debt_is_charged_before_eviction(redis):
+    RateLimiter.local_buckets["rate_limit:user:idle"] = LocalBucket(tokens=8.0, synced_at=100.0, debt=2)
+    redis.buckets["rate_limit:user:idle"] = (8.0, 0.0)
+    redis.clock.now += rate_limiting.RATE_LIMIT_LOCAL_DEBT_AGE + 1
+
+    asyncio.run(RateLimiter({"user": "b"}).acquire())
+
+    assert redis.buckets["rate_limit:user:idle"][0] == 6
+    assert RateLimiter.local_buckets["rate_limit:user:idle"].debt == 0
+
+    redis.clock.now += rate_limiting.RATE_LIMIT_LOCAL_TTL + 1
+    asyncio.run(RateLimiter({"user": "b"}).acquire())
+
+    assert "rate_limit:user:idle" not in RateLimiter.local_buckets
@@ -11,4 +11,32 @@ SENTIMENTS = {
 }
 DEFAULT_SENTIMENT = "wise"
 DEFAULT_QUOTA = 1500
-GAME_LIST = ("Fortnite", "Minecraft", "Diablo IV", "Metroid Prime Remastered", "Horizon Call of the Mountain", "Star Wars Jedi: Survivor", "Final Fantasy XVI", "Street Fighter 6", "Among Us", "Call of Duty: Warzone", "Valorant", "League of Legends", "Grand Theft Auto V", "Elden Ring", "The Legend of Zelda: Tears of the Kingdom", "Assassin's Creed Valhalla", "Super Mario Odyssey", "Animal Crossing: New Horizons", "Overwatch", "Dark Souls III", "Red Dead Redemption 2", "Rocket League", "Ghost of Tsushima", "Genshin Impact")
\ No newline at end of file
+GAME_LIST = ("Fortnite", "Minecraft", "Diablo IV", "Metroid Prime Remastered", "Horizon Call of the Mountain", "Star Wars Jedi: Survivor", "Final Fantasy XVI", "Street Fighter 6", "Among Us", "Call of Duty: Warzone", "Valorant", "League of Legends", "Grand Theft Auto V", "Elden Ring", "The Legend of Zelda: Tears of the Kingdom", "Assassin's Creed Valhalla", "Super Mario Odyssey", "Animal Crossing: New Horizons", "Overwatch", "Dark Souls III", "Red Dead Redemption 2", "Rocket League", "Ghost of Tsushima", "Genshin Impact")
+RATE_LIMITS = {
+    "user": {"capacity": 5, "refill_rate": 5 / 60},
+    "guild": {"capacity": 40, "refill_rate": 40 / 60},
+    "openai": {"capacity": 300, "refill_rate": 300 / 60},
+    "firefly": {"capacity": 30, "refill_rate": 30 / 60}
+}
+RATE_LIMIT_LOCAL_TTL = 2
+RATE_LIMIT_LOCAL_HEADROOM = 0.5
+RATE_LIMIT_LOCAL_DEBT_AGE = 10
+DEFAULT_ROUTING = {
+    "model": "gpt-3.5-turbo",
+    "deep_model": None,
+    "legacy_model": "text-davinci-003",
+    "short_prompt_length": 40,
+    "long_prompt_length": 400,
+    "short_max_tokens": 150,
+    "medium_max_tokens": 425,
+    "long_max_tokens": 800,
+    "min_max_tokens": 60,
+    "system_prompt_tokens": 180,
+    "functions_tokens": 120,
+    "low_quota": 100,
+    "short_latency_threshold": 6,
+    "medium_latency_threshold": 12,
+    "long_latency_threshold": 25,
+    "error_rate_threshold": 0.3
+}
+GUILD_ROUTING = {}
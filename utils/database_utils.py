@@ -2,16 +2,10 @@ import asyncio
 import os
 import hashlib
 import time
-from dotenv import load_dotenv
-from redis.asyncio import Redis as aioredis
 from typing import NamedTuple, Self
 from utils.constants import DEFAULT_SENTIMENT, DEFAULT_QUOTA
 from utils.miscellaneous import calc_refresh_time
 
-load_dotenv()
-REDIS_PWD = os.getenv("REDIS_PWD")
-SALTING_VALUE = os.getenv("SALTING_VALUE")
-
 
 class RedisConnection:
     """
@@ -24,7 +18,9 @@ class RedisConnection:
         self.conn = None
 
     async def __aenter__(self):
-        self.conn = await aioredis(host="0.0.0.0", port=8080, db=self.db, password=REDIS_PWD, decode_responses=True)
+        from redis.asyncio import Redis as aioredis
+
+        self.conn = await aioredis(host="0.0.0.0", port=8080, db=self.db, password=os.getenv("REDIS_PWD"), decode_responses=True)
         return self.conn
 
     async def __aexit__(self, exc_type, exc, tb):
@@ -59,7 +55,7 @@ class UserSettingsHandler:
 
         :return: The hashed user ID.
         """
-        return hashlib.blake2b((SALTING_VALUE + str(user_id)).encode(), digest_size=16).hexdigest()
+        return hashlib.blake2b((os.getenv("SALTING_VALUE") + str(user_id)).encode(), digest_size=16).hexdigest()
 
     async def get_user_settings(self) -> Self:
         """
@@ -3,8 +3,6 @@ import asyncio
 import discord
 import io
 import logging
-import pyfirefly
-from pyfirefly.utils import ImageOptions
 
 
 class ImageGenerator:
@@ -13,8 +11,6 @@ class ImageGenerator:
 
     :param aspect_ratio: The aspect ratio of the generated images.
     """
-    FIREFLY_BEARER_TOKEN = os.getenv("FIREFLY_BEARER_TOKEN")
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     def __init__(self, aspect_ratio: str):
         self.firefly_session = None
@@ -23,10 +19,13 @@ class ImageGenerator:
 
     async def __aenter__(self):
         """
-        Create a new Adobe Firefly session.
+        Create a new Adobe Firefly session, pyfirefly is only imported once the first image is requested.
         """
+        import pyfirefly
+        from pyfirefly.utils import ImageOptions
+
         try:
-            self.firefly_session = await pyfirefly.Firefly(self.FIREFLY_BEARER_TOKEN)
+            self.firefly_session = await pyfirefly.Firefly(os.getenv("FIREFLY_BEARER_TOKEN"))
             self.img = ImageOptions(image_styles=self.firefly_session.image_styles)
             self.img.set_aspect_ratio(self.aspect_ratio)
         except pyfirefly.exceptions.Unauthorized:
@@ -63,6 +62,8 @@ class ImageGenerator:
             logging.error(f"Cannot generate image {filename}. No Adobe Firefly session.")
             return None
 
+        import pyfirefly
+
         try:
             result = await self.firefly_session.text_to_image(prompt, **img_options.options)
             logging.info(f"Successfully generated image {filename}")
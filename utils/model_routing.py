@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+from typing import NamedTuple
+from utils.constants import DEFAULT_ROUTING, GUILD_ROUTING
+from utils.database_utils import RedisConnection
+
+
+class RoutingDecision(NamedTuple):
+    model: str
+    max_tokens: int
+    attach_functions: bool
+    tier: str
+    degraded: bool
+    prompt_tokens: int = 0
+
+
+class UpstreamStats:
+    """
+    Exponentially weighted latency and error rate of an upstream model.
+    """
+    SMOOTHING = 0.2
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+
+    def record(self, latency: float | None):
+        """
+        Record the outcome of a request.
+
+        :param latency: The latency of the request in seconds, None if it failed.
+        """
+        self.error_rate += self.SMOOTHING * ((latency is None) - self.error_rate)
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + self.SMOOTHING * (latency - self.latency)
+
+
+class ModelRouter:
+    """
+    Router picking the model, max_tokens and whether functions are attached for a completion.
+
+    :param guild_id: The ID of the guild the message was sent in, None for DMs.
+    """
+    TIERS = ("short", "medium", "long")
+    STATS_RETENTION = 60 * 60 * 24 * 30
+    STATS_FLUSH_INTERVAL = 60
+    upstream_stats: dict[tuple[str, str], UpstreamStats] = {}
+    pending_stats: Counter = Counter()
+    flush_task = None
+
+    def __init__(self, guild_id: int | None):
+        self.config = DEFAULT_ROUTING | GUILD_ROUTING.get(guild_id, {})
+
+    def is_degraded(self, model: str, tier: str) -> bool:
+        """
+        Check if the upstream latency or error rate of a model exceeds the configured thresholds of a tier.
+        Latency is tracked per tier, since long answers naturally take longer than short ones.
+
+        :param model: The model to check.
+        :param tier: The tier to check the model in.
+
+        :return: Whether the model is degraded.
+        """
+        stats = self.upstream_stats.get((model, tier))
+        if stats is None:
+            return False
+
+        return stats.error_rate > self.config["error_rate_threshold"] or stats.latency is not None and stats.latency > self.config[f"{tier}_latency_threshold"]
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Roughly estimate the amount of tokens of a text, assuming about four characters per token.
+
+        :param text: The text to estimate the tokens of.
+
+        :return: The estimated amount of tokens.
+        """
+        return math.ceil(len(text) / 4)
+
+    def route(self, prompt: str, quota: int, allow_images: bool, charge_tokens: bool, legacy: bool = False, prompt_tokens: int = 0) -> RoutingDecision:
+        """
+        Route a completion based on the prompt length, the user's remaining quota and the upstream load.
+
+        :param prompt: The prompt as sent by the user.
+        :param quota: The user's remaining quota.
+        :param allow_images: Whether the user allows image attachments.
+        :param charge_tokens: Whether the user will be charged tokens for the completion.
+        :param legacy: Whether the legacy model is used.
+        :param prompt_tokens: The estimated tokens of the prepared prompt, without the system prompt and functions.
+
+        :return: The routing decision.
+        """
+        if len(prompt) < self.config["short_prompt_length"]:
+            tier = "short"
+        elif len(prompt) >= self.config["long_prompt_length"]:
+            tier = "long"
+        else:
+            tier = "medium"
+
+        return self.route_tier(tier, quota, allow_images, charge_tokens, legacy, prompt_tokens)
+
+    def escalate(self, decision: RoutingDecision, quota: int, allow_images: bool, charge_tokens: bool, legacy: bool = False) -> RoutingDecision | None:
+        """
+        Route a completion that ran out of tokens to the next tier.
+        A degraded model is never escalated, since it should be backing off instead.
+
+        :param decision: The routing decision the completion ran out of tokens with.
+        :param quota: The user's remaining quota.
+        :param allow_images: Whether the user allows image attachments.
+        :param charge_tokens: Whether the user will be charged tokens for the completion.
+        :param legacy: Whether the legacy model is used.
+
+        :return: The routing decision of the next tier, None if it doesn't allow more tokens.
+        """
+        if decision.degraded or decision.tier == self.TIERS[-1]:
+            return None
+
+        escalated = self.route_tier(self.TIERS[self.TIERS.index(decision.tier) + 1], quota, allow_images, charge_tokens, legacy, decision.prompt_tokens)
+        return escalated if escalated.max_tokens > decision.max_tokens else None
+
+    def route_tier(self, tier: str, quota: int, allow_images: bool, charge_tokens: bool, legacy: bool = False, prompt_tokens: int = 0) -> RoutingDecision:
+        """
+        Route a completion within a tier.
+
+        :param tier: The tier to route the completion in.
+        :param quota: The user's remaining quota.
+        :param allow_images: Whether the user allows image attachments.
+        :param charge_tokens: Whether the user will be charged tokens for the completion.
+        :param legacy: Whether the legacy model is used.
+        :param prompt_tokens: The estimated tokens of the prepared prompt, without the system prompt and functions.
+
+        :return: The routing decision.
+        """
+        if legacy:
+            model = self.config["legacy_model"]
+        elif tier == "long" and self.config["deep_model"] and not self.is_degraded(self.config["deep_model"], tier):
+            model = self.config["deep_model"]
+        else:
+            model = self.config["model"]
+
+        degraded = self.is_degraded(model, tier)
+        attach_functions = bool(allow_images) and not legacy and not degraded and (not charge_tokens or quota >= self.config["low_quota"])
+
+        max_tokens = max(self.config[f"{tier}_max_tokens"] // (2 if degraded else 1), self.config["min_max_tokens"])
+        if charge_tokens:
+            # The prompt is charged as well, the legacy model charges every token, the chat models only every tenth
+            request_tokens = prompt_tokens
+            if not legacy:
+                request_tokens += self.config["system_prompt_tokens"] + (self.config["functions_tokens"] if attach_functions else 0)
+            max_tokens = max(min(max_tokens, (quota if legacy else quota * 10) - request_tokens), 1)
+
+        return RoutingDecision(model=model, max_tokens=max_tokens, attach_functions=attach_functions, tier=tier, degraded=degraded, prompt_tokens=prompt_tokens)
+
+    def record(self, decision: RoutingDecision, latency: float | None, total_tokens: int = 0):
+        """
+        Record the outcome of a routed completion in the upstream statistics and queue it for Redis.
+
+        :param decision: The routing decision the completion was made with.
+        :param latency: The latency of the completion in seconds, None if it failed.
+        :param total_tokens: The total tokens used by the completion.
+        """
+        self.upstream_stats.setdefault((decision.model, decision.tier), UpstreamStats()).record(latency)
+        logging.info(f"Routed {decision.tier} prompt to {decision.model} (max_tokens={decision.max_tokens}, functions={decision.attach_functions}, degraded={decision.degraded}): " + (f"{latency:.2f}s, {total_tokens} tokens" if latency is not None else "failed"))
+
+        key = f"routing_stats:{time.strftime('%Y-%m-%d', time.gmtime())}"
+        field = f"{decision.model}:{decision.tier}"
+        self.pending_stats[key, f"{field}:requests"] += 1
+        if latency is None:
+            self.pending_stats[key, f"{field}:errors"] += 1
+        else:
+            self.pending_stats[key, f"{field}:tokens"] += total_tokens
+            self.pending_stats[key, f"{field}:latency_ms"] += int(latency * 1000)
+        if decision.attach_functions:
+            self.pending_stats[key, f"{field}:functions"] += 1
+        if decision.degraded:
+            self.pending_stats[key, f"{field}:degraded"] += 1
+
+        if ModelRouter.flush_task is None or ModelRouter.flush_task.done():
+            ModelRouter.flush_task = asyncio.create_task(self.flush_stats())
+
+    async def flush_stats(self):
+        """
+        Periodically add the queued routing statistics to the daily routing statistics in Redis.
+        """
+        while True:
+            await asyncio.sleep(self.STATS_FLUSH_INTERVAL)
+            if not ModelRouter.pending_stats:
+                continue
+
+            stats, ModelRouter.pending_stats = ModelRouter.pending_stats, Counter()
+            try:
+                async with RedisConnection() as r, r.pipeline(transaction=True) as pipe:
+                    for (key, field), amount in stats.items():
+                        await pipe.hincrby(key, field, amount)
+                    for key in {key for key, _ in stats}:
+                        await pipe.expire(key, self.STATS_RETENTION)
+                    await pipe.execute()
+            except Exception as e:
+                logging.error(f"An error occurred while saving the routing statistics: {e}")
+                ModelRouter.pending_stats.update(stats)
@@ -1,12 +1,25 @@
 import discord
 import json
-import openai
 import os
 import time
+from functools import cache
 from utils.constants import SENTIMENTS, PRIVILEGED_GUILDS
 from utils.database_utils import UserSettingsHandler
-from utils.image_generation import ImageGenerator
 from utils.miscellaneous import capitalize_first_letter, beautified_date
+from utils.model_routing import ModelRouter, RoutingDecision
+from utils.rate_limiting import RateLimiter
+
+
+@cache
+def openai_client():
+    """
+    Import and configure the OpenAI module on first use instead of at startup.
+
+    :return: The configured openai module.
+    """
+    import openai
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    return openai
 
 
 class CompletionHandler:
@@ -16,9 +29,9 @@ class CompletionHandler:
     :param user_settings: The user settings of the user who sent the message.
     """
     CONNECTION_ERROR_MESSAGE = "I'm currently experiencing connection difficulties, please try again later."
+    MAX_ESCALATIONS = 2
 
     def __init__(self, user_settings: UserSettingsHandler):
-        openai.api_key = os.getenv("OPENAI_API_KEY")
         self.user_settings = user_settings
 
     @staticmethod
@@ -79,11 +92,12 @@ class CompletionHandler:
 
         return prompt
 
-    def prepare_preprompt(self, message: discord.message.Message, preprompts_args: str = None) -> str:
+    def prepare_preprompt(self, message: discord.message.Message, route: RoutingDecision, preprompts_args: str = None) -> str:
         """
         Prepare the preprompt for completion.
         
         :param message: The message to prepare the preprompt for.
+        :param route: The routing decision of the completion, images can only be offered if functions are attached.
         :param preprompts_args: Additional preprompt information.
 
         :return: The prepared preprompt.
@@ -93,21 +107,35 @@ class CompletionHandler:
         current_date = beautified_date()
         current_time = time.strftime("%H:%M", time.gmtime())
 
-        return f"You are not an AI language model but a divine creature named Nerd Muffin instead, respond {selected_sentiment_suffix}, {'you can ONLY attach AI-generated images made by Adobe Firefly to your message, only attach images when absolutely necessary' if self.user_settings.allow_images else 'you cannot attach any or share any images'}, be a friend and not an assistant, also be concise, your pronouns are they/them, reply in the same language the user used, this conversation takes place inside a {environment} (use Discord text formatting), the current date is {current_date} and the current time is {current_time} in the UTC timezone{', ' + preprompts_args if preprompts_args else ''}."
+        return f"You are not an AI language model but a divine creature named Nerd Muffin instead, respond {selected_sentiment_suffix}, {'you can ONLY attach AI-generated images made by Adobe Firefly to your message, only attach images when absolutely necessary' if route.attach_functions else 'you cannot attach any or share any images'}, be a friend and not an assistant, also be concise, your pronouns are they/them, reply in the same language the user used, this conversation takes place inside a {environment} (use Discord text formatting), the current date is {current_date} and the current time is {current_time} in the UTC timezone{', ' + preprompts_args if preprompts_args else ''}."
 
-    async def handle_image_gen_function_call(self, message: discord.message.Message, completion_messages: list[dict, ...], response_message: dict) -> tuple[str, list[discord.File | None, ...]]:
+    async def handle_image_gen_function_call(self, message: discord.message.Message, completion_messages: list[dict, ...], response_message: dict, router: ModelRouter, route: RoutingDecision) -> tuple[str, list[discord.File | None, ...]]:
         """
         Image generation function call handler.
         
         :param message: The message to handle the function call for.
         :param completion_messages: The completion messages to append the response to.
         :param response_message: The response message to handle.
+        :param router: The model router to record the follow-up completion with.
+        :param route: The routing decision of the completion.
 
         :return: The response message and the image locations.
         """
-        args = json.loads(response_message["function_call"]["arguments"])
-        async with ImageGenerator(args.get("aspect_ratio")) as image_generator:
-            image_locations = await image_generator.generate_images(message.id, args.get("descriptions"))
+        from utils.image_generation import ImageGenerator
+
+        openai = openai_client()
+        try:
+            args = json.loads(response_message["function_call"]["arguments"])
+            descriptions = args.get("descriptions", [])
+        except json.JSONDecodeError:
+            # A function call cut off by max_tokens can't be parsed, so it is treated as a failed generation
+            args, descriptions = {}, None
+
+        if descriptions is not None and (await RateLimiter({"firefly": "global"}).acquire(len(descriptions))).allowed:
+            async with ImageGenerator(args.get("aspect_ratio")) as image_generator:
+                image_locations = await image_generator.generate_images(message.id, descriptions)
+        else:
+            image_locations = [None] * len(descriptions or [None])
         success_state = not any(location is None for location in image_locations)
 
         completion_messages.append(response_message)
@@ -116,7 +144,9 @@ class CompletionHandler:
         else:
             completion_messages.append({"role": "function", "name": "generate_image", "content": "Failed to generate at least one image, sorry for that."})
 
-        response = await openai.ChatCompletion.acreate(model="gpt-3.5-turbo", messages=completion_messages, timeout=int(time.time() + 60))
+        started = time.monotonic()
+        response = await openai.ChatCompletion.acreate(model=route.model, messages=completion_messages, max_tokens=route.max_tokens, timeout=int(time.time() + 60))
+        router.record(route, time.monotonic() - started, int(response["usage"]["total_tokens"]))
 
         if self.charge_tokens(message):
             self.user_settings.quota -= int(response["usage"]["total_tokens"]) // 10
@@ -125,6 +155,27 @@ class CompletionHandler:
 
         return response_message, image_locations
 
+    async def escalate_route(self, router: ModelRouter, route: RoutingDecision, escalations: int, charge_tokens: bool, legacy: bool = False) -> RoutingDecision | None:
+        """
+        Route a truncated completion to the next tier if the escalation bound and the global OpenAI budget allow it.
+
+        :param router: The model router of the completion.
+        :param route: The routing decision the completion was truncated with.
+        :param escalations: How often the completion has already been escalated.
+        :param charge_tokens: Whether the user will be charged tokens for the completion.
+        :param legacy: Whether the legacy model is used.
+
+        :return: The routing decision of the next tier, None if the completion can't be escalated.
+        """
+        if escalations >= self.MAX_ESCALATIONS:
+            return None
+
+        escalated_route = router.escalate(route, self.user_settings.quota, self.user_settings.allow_images, charge_tokens, legacy)
+        if escalated_route is None or not (await RateLimiter({"openai": "global"}).acquire()).allowed:
+            return None
+
+        return escalated_route
+
     async def complete_prompt(self, message: discord.message.Message, prompt: str, preprompts_args: str = None) -> tuple[str, list[discord.File | None, ...]]:
         """
         Complete the prompt and return the response.
@@ -135,16 +186,22 @@ class CompletionHandler:
 
         :return: The response and the image locations.
         """
-        preprompt = self.prepare_preprompt(message, preprompts_args)
-        prompt = self.prepare_prompt(message, prompt)
+        openai = openai_client()
+        router = ModelRouter(message.guild.id if message.guild is not None else None)
+        prepared_prompt = self.prepare_prompt(message, prompt)
+        route = router.route(prompt, self.user_settings.quota, self.user_settings.allow_images, self.charge_tokens(message), prompt_tokens=router.estimate_tokens(prepared_prompt))
+        prompt = prepared_prompt
         image_locations = []
+        attempts, escalations = 0, 0
+        truncated_response = None
 
-        for _ in range(5):
+        # Escalations have their own bound, only transient errors count as attempts
+        while attempts < 5:
             try:
                 messages = [
                     {
                         "role": "system",
-                        "content": preprompt
+                        "content": self.prepare_preprompt(message, route, preprompts_args)
                     },
                     {
                         "role": "user",
@@ -178,26 +235,42 @@ class CompletionHandler:
                     }
                 ]
 
-                completion_args = {"model": "gpt-3.5-turbo", "messages": messages, "timeout": int(time.time() + 60)}
-                if self.user_settings.allow_images:
+                completion_args = {"model": route.model, "messages": messages, "max_tokens": route.max_tokens, "timeout": int(time.time() + 60)}
+                if route.attach_functions:
                     completion_args["functions"] = functions
 
+                started = time.monotonic()
                 response = await openai.ChatCompletion.acreate(**completion_args)
+                router.record(route, time.monotonic() - started, int(response["usage"]["total_tokens"]))
+                response_message = response["choices"][0]["message"]
+
+                if response["choices"][0]["finish_reason"] == "length" and not response_message.get("function_call"):
+                    escalated_route = await self.escalate_route(router, route, escalations, self.charge_tokens(message))
+                    if escalated_route is not None:
+                        # The truncated reply is only kept as a fallback, so the user isn't charged for it yet
+                        truncated_response = response
+                        route = escalated_route
+                        escalations += 1
+                        continue
 
                 if self.charge_tokens(message):
                     self.user_settings.quota -= int(response["usage"]["total_tokens"]) // 10
 
-                response_message = response["choices"][0]["message"]
-
                 if response_message.get("function_call"):
-                    response_message, image_locations = await self.handle_image_gen_function_call(message, messages, response_message)
+                    response_message, image_locations = await self.handle_image_gen_function_call(message, messages, response_message, router, route)
 
                 return response_message["content"].strip().strip("\""), image_locations
 
             except (openai.error.ServiceUnavailableError, openai.error.RateLimitError, openai.error.APIError):
-                pass
-        else:
-            return self.CONNECTION_ERROR_MESSAGE, image_locations
+                router.record(route, None)
+                attempts += 1
+
+        if truncated_response is not None:
+            if self.charge_tokens(message):
+                self.user_settings.quota -= int(truncated_response["usage"]["total_tokens"]) // 10
+            return truncated_response["choices"][0]["message"]["content"].strip().strip("\""), image_locations
+
+        return self.CONNECTION_ERROR_MESSAGE, image_locations
 
     async def complete_prompt_legacy(self, message: discord.message.Message, prompt: str) -> str:
         """
@@ -208,25 +281,48 @@ class CompletionHandler:
 
         :return: The response.
         """
-        prompt = self.prepare_prompt(message, prompt)
-
-        for _ in range(5):
+        openai = openai_client()
+        router = ModelRouter(message.guild.id if message.guild is not None else None)
+        prepared_prompt = self.prepare_prompt(message, prompt)
+        route = router.route(prompt, self.user_settings.quota, self.user_settings.allow_images, charge_tokens=True, legacy=True, prompt_tokens=router.estimate_tokens(prepared_prompt))
+        prompt = prepared_prompt
+        attempts, escalations = 0, 0
+        truncated_response = None
+
+        # Escalations have their own bound, only transient errors count as attempts
+        while attempts < 5:
             try:
+                started = time.monotonic()
                 response = await openai.Completion.acreate(
-                    engine="text-davinci-003",
+                    engine=route.model,
                     prompt=prompt,
                     temperature=0.9,
-                    max_tokens=425,
+                    max_tokens=route.max_tokens,
                     top_p=1,
                     frequency_penalty=0,
                     presence_penalty=0,
                     timeout=int(time.time() + 60)
                 )
+                router.record(route, time.monotonic() - started, int(response["usage"]["total_tokens"]))
+
+                if response["choices"][0]["finish_reason"] == "length":
+                    escalated_route = await self.escalate_route(router, route, escalations, charge_tokens=True, legacy=True)
+                    if escalated_route is not None:
+                        # The truncated reply is only kept as a fallback, so the user isn't charged for it yet
+                        truncated_response = response
+                        route = escalated_route
+                        escalations += 1
+                        continue
 
                 self.user_settings.quota -= int(response["usage"]["total_tokens"])
                 return response["choices"][0]["text"].strip().strip("\"")
 
             except (openai.error.ServiceUnavailableError, openai.error.RateLimitError, openai.error.APIError):
-                pass
-        else:
-            return self.CONNECTION_ERROR_MESSAGE
+                router.record(route, None)
+                attempts += 1
+
+        if truncated_response is not None:
+            self.user_settings.quota -= int(truncated_response["usage"]["total_tokens"])
+            return truncated_response["choices"][0]["text"].strip().strip("\"")
+
+        return self.CONNECTION_ERROR_MESSAGE
@@ -0,0 +1,167 @@
+import logging
+import time
+from typing import NamedTuple
+from utils.constants import RATE_LIMITS, RATE_LIMIT_LOCAL_TTL, RATE_LIMIT_LOCAL_HEADROOM, RATE_LIMIT_LOCAL_DEBT_AGE
+from utils.database_utils import RedisConnection
+
+# KEYS are the bucket keys, ARGV holds the capacity, refill rate and locally granted debt of every bucket followed by the cost.
+# The debt is always charged, the cost only if every bucket can cover it, so either all buckets are drawn from or none.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[#ARGV])
+local tokens = {}
+local allowed = 1
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local refill_rate = tonumber(ARGV[i * 3 - 1])
+    local bucket = redis.call("HMGET", key, "tokens", "updated_at")
+    local available = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+
+    tokens[i] = math.min(capacity, available + math.max(0, now - updated_at) * refill_rate) - math.max(0, tonumber(ARGV[i * 3]))
+    if tokens[i] < cost then
+        allowed = 0
+        retry_after = math.max(retry_after, (cost - tokens[i]) / refill_rate)
+    end
+end
+
+local result = {allowed, tostring(retry_after)}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local refill_rate = tonumber(ARGV[i * 3 - 1])
+    if allowed == 1 then
+        tokens[i] = tokens[i] - cost
+    end
+
+    redis.call("HSET", key, "tokens", tostring(tokens[i]), "updated_at", tostring(now))
+    redis.call("PEXPIRE", key, math.ceil((capacity - tokens[i]) / refill_rate * 1000) + 1000)
+    result[i + 2] = tostring(tokens[i])
+end
+
+return result
+"""
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    retry_after: float
+
+
+class LocalBucket(NamedTuple):
+    tokens: float
+    synced_at: float
+    debt: int
+    in_flight: int = 0
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter shared by all bot processes through Redis.
+
+    :param limits: The limits to draw from, mapping a limit name from RATE_LIMITS to the identifier of its bucket.
+    """
+    local_buckets: dict[str, LocalBucket] = {}
+    token_bucket_script = None
+
+    def __init__(self, limits: dict[str, str | int]):
+        self.buckets = {f"rate_limit:{limit}:{identifier}": limit for limit, identifier in limits.items()}
+
+    def acquire_locally(self, cost: int) -> bool:
+        """
+        Grant the request without asking Redis if every bucket was synced recently and is clearly under its limit.
+        The granted tokens are remembered as debt and charged on the next sync.
+
+        :param cost: The amount of tokens to draw from every bucket.
+
+        :return: Whether the request was granted locally.
+        """
+        now = time.monotonic()
+        for key, limit in self.buckets.items():
+            bucket = self.local_buckets.get(key)
+            if bucket is None or now - bucket.synced_at > RATE_LIMIT_LOCAL_TTL:
+                return False
+            if bucket.tokens - bucket.debt - bucket.in_flight - cost < RATE_LIMITS[limit]["capacity"] * RATE_LIMIT_LOCAL_HEADROOM:
+                return False
+
+        for key in self.buckets:
+            self.local_buckets[key] = self.local_buckets[key]._replace(debt=self.local_buckets[key].debt + cost)
+
+        return True
+
+    @classmethod
+    async def sync_buckets(cls, r, buckets: dict[str, str], cost: int) -> RateLimitResult:
+        """
+        Charge the local debt of the buckets and draw tokens from all of them or from none in Redis.
+
+        :param r: The Redis connection to use.
+        :param buckets: The buckets to sync, mapping the bucket key to its limit name.
+        :param cost: The amount of tokens to draw from every bucket.
+
+        :return: Whether the request is allowed and how many seconds to wait otherwise.
+        """
+        # The debt is moved in flight so concurrent syncs don't charge it twice, while local grants still account for it
+        debts = {}
+        for key in buckets:
+            bucket = cls.local_buckets.get(key)
+            debts[key] = bucket.debt if bucket is not None else 0
+            if bucket is not None:
+                cls.local_buckets[key] = bucket._replace(debt=0, in_flight=bucket.in_flight + bucket.debt)
+
+        args = []
+        for key, limit in buckets.items():
+            args += [RATE_LIMITS[limit]["capacity"], RATE_LIMITS[limit]["refill_rate"], debts[key]]
+        args.append(cost)
+
+        if cls.token_bucket_script is None:
+            cls.token_bucket_script = r.register_script(TOKEN_BUCKET_SCRIPT)
+
+        try:
+            allowed, retry_after, *remaining = await cls.token_bucket_script(keys=list(buckets), args=args, client=r)
+        except Exception:
+            for key, debt in debts.items():
+                if key in cls.local_buckets:
+                    bucket = cls.local_buckets[key]
+                    cls.local_buckets[key] = bucket._replace(debt=bucket.debt + debt, in_flight=max(bucket.in_flight - debt, 0))
+            raise
+
+        synced_at = time.monotonic()
+        for key, tokens in zip(buckets, remaining):
+            bucket = cls.local_buckets.get(key)
+            # Debt granted locally while waiting for Redis has not been charged yet
+            debt = bucket.debt if bucket is not None else 0
+            in_flight = max(bucket.in_flight - debts[key], 0) if bucket is not None else 0
+            cls.local_buckets[key] = LocalBucket(tokens=float(tokens), synced_at=synced_at, debt=debt, in_flight=in_flight)
+
+        return RateLimitResult(allowed=bool(allowed), retry_after=float(retry_after))
+
+    async def acquire(self, cost: int = 1) -> RateLimitResult:
+        """
+        Draw tokens from every bucket, either from all of them or from none.
+
+        :param cost: The amount of tokens to draw from every bucket.
+
+        :return: Whether the request is allowed and how many seconds to wait otherwise.
+        """
+        if self.acquire_locally(cost):
+            return RateLimitResult(allowed=True, retry_after=0)
+
+        async with RedisConnection() as r:
+            result = await self.sync_buckets(r, self.buckets, cost)
+
+            # Debt of buckets that weren't synced again in a while is charged before they are evicted
+            now = time.monotonic()
+            stale_buckets = {key: key.split(":")[1] for key, bucket in self.local_buckets.items() if bucket.debt and now - bucket.synced_at > RATE_LIMIT_LOCAL_DEBT_AGE}
+            if stale_buckets:
+                try:
+                    await self.sync_buckets(r, stale_buckets, 0)
+                except Exception as e:
+                    logging.error(f"An error occurred while charging the debt of stale rate limit buckets: {e}")
+
+        now = time.monotonic()
+        for key in [key for key, bucket in self.local_buckets.items() if now - bucket.synced_at > RATE_LIMIT_LOCAL_TTL and not bucket.debt and not bucket.in_flight]:
+            del self.local_buckets[key]
+
+        return result